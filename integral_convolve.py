@@ -1,6 +1,9 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib
+from functools import lru_cache
+from scipy.fft import fft2, ifft2
+from numba import njit, prange
 from numpy.linalg import eig
 from matplotlib.figure import figaspect
 from matplotlib import rc
@@ -9,19 +12,73 @@ from matplotlib import rc
 matplotlib.rcParams['mathtext.fontset'] = 'cm'
 matplotlib.rcParams['font.family'] = 'STIXGeneral'
 
+## single precision for the operator/solve pipeline: the builds are memory-bound
+## and the discretization error dominates float32 roundoff at every n used here
+DTYPE = np.float32
+
 
 def exp_kernel(distance):
     return np.exp(-distance)
 
+def lattice_points(i, n):
+    """ Map lattice indices to coordinates on the wrap-around 1x1 lattice.
+        i may be a scalar or an array of indices in 0,1,...,n^2-1."""
+    i = np.asarray(i)
+    return np.stack([(i//n)/n, (i%n)/n], axis=-1).astype(DTYPE)
+
+@lru_cache(maxsize=None)
+def axis_distances(n):
+    """ n x n table of wrapped distances between the n lattice coordinates along one axis.
+        Cached per n, since every matrix/filter build at the same resolution reuses it."""
+    x = np.arange(n, dtype=DTYPE)/n
+    diff = np.abs(x[:,None] - x[None,:])
+    return np.where(diff<1/2, diff, 1-diff)
+
 def cross_correlation(n, kernel_func, lamb):
     """ Construct the full matrix (I+lambda*K) (dim n^2 x n^2) in the equation: g = (I+K)f"""
-    result = np.zeros([n**2,n**2])
-    for i in range(n**2):
-        for j in range(n**2):
-            result[i,j]= lamb*matrix_entry(i,j,n, kernel_func)
-            if i==j:
-                result[i,j] = result[i,j] + 1
-    return result
+    d = axis_distances(n)
+    ## Manhatten distance on a wrap around lattice of size 1x1 separates across the two axes,
+    ## so the n^2 x n^2 distance matrix is a broadcast sum of two n x n tables
+    distance = (d[:,None,:,None] + d[None,:,None,:]).reshape(n**2, n**2)
+    return lamb*(1/n**2)*kernel_func(distance) + np.identity(n**2, dtype=DTYPE)
+
+_jit_builders = {}
+
+def make_builder(kernel_func):
+    """ Compile an elementwise matrix builder with the kernel resolved at JIT time.
+        Capturing the jitted kernel in a closure lets LLVM inline it into the loop
+        body, instead of dispatching through a Python function object per entry.
+        Compiled builders are cached per kernel."""
+    if kernel_func not in _jit_builders:
+        kernel = njit(kernel_func)
+        @njit(parallel=True, fastmath=True)
+        def build(n, lamb):
+            ## the kernel is symmetric in its arguments, so only the upper triangle
+            ## is computed and mirrored; each (i,j) pair is written once, from row min(i,j)
+            result = np.empty((n**2, n**2), dtype=np.float32)
+            for i in prange(n**2):
+                x1 = (i//n)/n
+                y1 = (i%n)/n
+                result[i,i] = lamb*(1/n**2)*kernel(0.0) + 1
+                for j in range(i+1, n**2):
+                    dx = abs(x1 - (j//n)/n)
+                    if dx >= 1/2:
+                        dx = 1 - dx
+                    dy = abs(y1 - (j%n)/n)
+                    if dy >= 1/2:
+                        dy = 1 - dy
+                    entry = lamb*(1/n**2)*kernel(dx+dy)
+                    result[i,j] = entry
+                    result[j,i] = entry
+            return result
+        _jit_builders[kernel_func] = build
+    return _jit_builders[kernel_func]
+
+def cross_correlation_jit(n, kernel_func, lamb):
+    """ Explicit elementwise build of (I+lambda*K), JIT-compiled with Numba and
+        parallelized over rows. Equivalent to cross_correlation(n, kernel_func, lamb);
+        keeps the pointwise form available for kernels that do not vectorize."""
+    return make_builder(kernel_func)(n, lamb)
 
 def matrix_entry(i, j, n, kernel_func):
     """ Return the (i,j) entry of the matrix K(‖x−x′‖),
@@ -29,43 +86,68 @@ def matrix_entry(i, j, n, kernel_func):
         i, j =  0,1,..., n^2-1
         If self_interact is false, the K(x,x') is undefined -> set to 0 
     """
-    x1 = (i//n)/n; y1 = (i%n)/n; point1 = np.array([x1,y1])
-    x2 = (j//n)/n; y2 = (j%n)/n; point2 = np.array([x2,y2])
-
-    diff = np.abs(point1-point2)
-    distance = np.sum(np.where(diff<1/2, diff, 1-diff))    ## Manhatten distance on a wrap around lattice of size 1x1
+    dx = abs((i//n)/n - (j//n)/n)
+    if dx >= 1/2:
+        dx = 1 - dx
+    dy = abs((i%n)/n - (j%n)/n)
+    if dy >= 1/2:
+        dy = 1 - dy
+    distance = dx + dy    ## Manhatten distance on a wrap around lattice of size 1x1
     entry = (1/n**2)*kernel_func(distance)
     return entry
 
 def get_cyclic_reps(N):
     """ Return regular representations of cyclic group, sorted in ascending order of group elements: i.e. 0,1,..N-1"""
-    A = []
-    for i in range(N-1,-1,-1):
-        A.append([1 if j == i else 0 for j in range(N)])
-    perms = []    
-    for i in range(N):
-        perms.append(np.array([A[i-j] for j in range(N)]))
-    I = perms.pop(-1)
-    return [I] + perms
+    I = np.eye(N)
+    return [np.roll(I, k, axis=0) for k in range(N)]
 
 def get_cyclic_product_reps(N):
-    """ Return INVERSE regular representations (permutation matrices of size N^2 x N^2) of the direct product of a cyclic group to itself, 
-            sorted in ascending order of group elements: i.e. (0,0),(0,1),,..(N-1,N-1)"""
-    group1 = get_cyclic_reps(N)
-    group2 = get_cyclic_reps(N)
+    """ Return INVERSE regular representations (permutation matrices of size N^2 x N^2) of the direct product of a cyclic group to itself,
+            sorted in ascending order of group elements: i.e. (0,0),(0,1),,..(N-1,N-1)
+        The rep of (a,b) permutes lattice index i = (i//N, i%N) to ((i//N+a)%N, (i%N+b)%N),
+        so it is built by index arithmetic on the identity instead of a Kronecker product."""
+    I = np.identity(N**2)
+    row = np.arange(N**2)
     reps = []
-    for mat1 in group1:
-        for mat2 in group2:
-            reps.append(np.kron(mat1, mat2))
-    sorted_reps = sorted(reps, key= lambda mat: np.argmax(mat[:,0]))
-    return [rep.T for rep in sorted_reps]
+    for a in range(N):
+        for b in range(N):
+            col = ((row//N + a) % N)*N + (row % N + b) % N
+            reps.append(I[col])
+    return reps
 
 def get_filter(N, kernel_func, lamb):
     """ first column of cross-correlation matrix"""
-    m = [lamb*matrix_entry(0, 0, N, kernel_func)+1]
-    for j in range(1,N**2):
-            m.append(lamb*matrix_entry(0,j,N, kernel_func))
-    return np.array(m)
+    ## separate per-axis distance vectors from point 0 (structure-of-arrays layout),
+    ## combined with an outer sum — every operation runs on contiguous 1D data
+    d0 = axis_distances(N)[0]
+    distance = np.add.outer(d0, d0).ravel()
+    m = lamb*(1/N**2)*kernel_func(distance)
+    m[0] = m[0] + 1
+    return m
+
+def bccb_matvec(filter, x, N):
+    """ Apply the BCCB operator defined by its first column (the filter) to a vector x,
+        as a 2D circular convolution — no dense N^2 x N^2 matrix is ever assembled."""
+    F = fft2(filter.reshape(N, N), workers=-1)
+    return np.real(ifft2(F*fft2(x.reshape(N, N), workers=-1), workers=-1)).ravel()
+
+@lru_cache(maxsize=None)
+def spectral_filter(N, kernel_func, lamb):
+    """ 2D-DFT of the filter, cached per (N, kernel, lamb) so repeated solves at the
+        same settings (e.g. parameter sweeps) pay for the filter FFT only once."""
+    return fft2(get_filter(N, kernel_func, lamb).reshape(N, N), workers=-1)
+
+def solve_fft(N, kernel_func, lamb, g_vec):
+    """ Solve (I+lambda*K)f = g by diagonalizing the operator with a 2D FFT.
+        The cross-correlation matrix is block-circulant with circulant blocks (BCCB),
+        so applying its inverse is an element-wise division in the 2D-DFT domain."""
+    G = fft2(g_vec.reshape(N, N), workers=-1)
+    return np.real(ifft2(G/spectral_filter(N, kernel_func, lamb), workers=-1)).ravel()
+
+def solve_dense(N, kernel_func, lamb, g_vec):
+    """ Explicit assembly and dense solve, kept for validating solve_fft."""
+    A = cross_correlation(N, kernel_func, lamb)
+    return np.linalg.solve(A, g_vec)
 
 def f(x, y):
     """ Function on lattice to be solved."""
@@ -89,18 +171,12 @@ def g(x,y, lamb):
     return f(x, y) + lamb*vfunc(x)*vfunc(y)
 
 def discretized_f(N):
-    vec = []
-    for i in range(N):
-        for j in range(N):
-            vec.append(f(i/N, j/N))
-    return np.array(vec)
+    X, Y = np.meshgrid(np.arange(N)/N, np.arange(N)/N, indexing='ij')
+    return f(X, Y).ravel().astype(DTYPE)
 
 def discretized_g(lamb, N):
-    vec = []
-    for i in range(N):
-        for j in range(N):
-            vec.append(g(i/N, j/N, lamb))
-    return np.array(vec)
+    X, Y = np.meshgrid(np.arange(N)/N, np.arange(N)/N, indexing='ij')
+    return g(X, Y, lamb).ravel().astype(DTYPE)
 
 # N1=50
 # X,Y = np.meshgrid(1/N1*np.array(list(range(N1))), 1/N1*np.array(list(range(N1))))
@@ -115,23 +191,21 @@ def plot_solution():
     kernel = exp_kernel
     lamb = 1
     fig = plt.figure(figsize=(8.2,2.3))
-    err = []   
+    ns = np.array([4,16,64])
+    err = np.empty(len(ns))
 
-    for index, n in enumerate([4,16,64]):
-        ######### Verifying the matrix is indeed a group cross-correlation    
-        # reps = get_cyclic_product_reps(n)
+    for index, n in enumerate(ns):
+        ######### Verifying the matrix is indeed a group cross-correlation
         # filter = get_filter(n, kernel, lamb)
-        # approx = np.zeros([n**2, n**2])
-        # for i in range(n**2):
-        #    approx = approx + filter[i]*reps[i]
+        # x = np.random.default_rng(0).standard_normal(n**2)
+        # print(np.linalg.norm(bccb_matvec(filter, x, n) - cross_correlation(n, kernel, lamb)@x))
 
-        A = cross_correlation(n, kernel, lamb)
-        # print(np.linalg.norm(approx-A, ord='fro')/(n**4))
+        F = spectral_filter(n, kernel, lamb)
 
         g_vec = discretized_g(lamb, n)
-        sol = np.reshape(np.linalg.inv(A)@np.array([g_vec]).T,-1)
+        sol = np.real(ifft2(fft2(g_vec.reshape(n, n), workers=-1)/F, workers=-1)).ravel()
 
-        eigs, _ = np.linalg.eig(A)
+        eigs = F.ravel()    ## eigenvalues of a BCCB matrix are the 2D-DFT of its filter
         kappa = np.max(np.abs(eigs))/np.min(np.abs(eigs))
         print("n = " + str(n))
         print("Condition number = " + str(np.round(kappa,4)))
@@ -139,9 +213,9 @@ def plot_solution():
         print("Minimum singular value magnitude  = " + str(np.min(np.abs(eigs))))
 
         f_vec = discretized_f(n)
-        err.append(np.mean(np.abs(sol-f_vec)))
+        err[index] = np.mean(np.abs(sol-f_vec))
 
-        ##### 3D plots  
+        ##### 3D plots
         xs = np.repeat(1/n*np.array(list(range(n))),n)
         ys = np.tile(1/n*np.array(list(range(n))),n)
         
@@ -194,31 +268,22 @@ def plot_error():
     kernel = exp_kernel
     lamb = 1
     fig = plt.figure(figsize=(5.2,3.5))
-    err = []   
     ns = np.array([4,8,16,32,64])
+    err = np.empty(len(ns))
     for index, n in enumerate(ns):
-        ######### Verifying the matrix is indeed a group cross-correlation    
-        # reps = get_cyclic_product_reps(n)
-        # filter = get_filter(n, kernel, lamb)
-        # approx = np.zeros([n**2, n**2])
-        # for i in range(n**2):
-        #    approx = approx + filter[i]*reps[i]
-
-        A = cross_correlation(n, kernel, lamb)
-        # print(np.linalg.norm(approx-A, ord='fro')/(n**4))
+        F = spectral_filter(n, kernel, lamb)
 
         g_vec = discretized_g(lamb, n)
-        sol = np.reshape(np.linalg.inv(A)@np.array([g_vec]).T,-1)
+        sol = np.real(ifft2(fft2(g_vec.reshape(n, n), workers=-1)/F, workers=-1)).ravel()
 
-        eigs, _ = np.linalg.eig(A)
+        eigs = F.ravel()    ## eigenvalues of a BCCB matrix are the 2D-DFT of its filter
         kappa = np.max(np.abs(eigs))/np.min(np.abs(eigs))
         print("n = " + str(n))
         print("Condition number = " + str(np.round(kappa,4)))
         # print(np.max(np.abs(eigs)))
 
         f_vec = discretized_f(n)
-        err.append(np.mean(np.abs(sol-f_vec)))
-    err = np.array(err)
+        err[index] = np.mean(np.abs(sol-f_vec))
     plt.plot(ns, err, 'o', zorder=5)
 
     logx = np.log10(ns); logy = np.log10(err)